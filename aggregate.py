@@ -0,0 +1,100 @@
+import logging
+from scoring import METRICS
+from lazy import lazy
+
+np = lazy("numpy")
+pd = lazy("pandas")
+
+class MetricTable:
+
+    # One row per credited person per message: the author and everyone they mention
+    def __init__(self, ts, authors, people, values, vocab):
+        self.ts = ts
+        self.authors = authors
+        self.people = people
+        self.values = values
+        self.vocab = vocab
+
+    @classmethod
+    def from_messages(cls, df, scores, users=None):
+        vocab = list(users) if users is not None else []
+        codes = {u: i for i, u in enumerate(vocab)}
+        ts, authors, people, values = [], [], [], []
+        for m in df.to_dict("records"):
+            try:
+                author, mentions, *totals = scores.get(str(m["ts"]), m["user"], m["text"])
+            except (ValueError, TypeError, KeyError) as e:
+                logging.info(f"Invalid message {m} - {e}")
+                continue
+            if not isinstance(author, str) or (users is not None and author not in codes):
+                continue
+            for p in [author] + mentions:
+                if p not in codes:
+                    if users is not None:
+                        continue
+                    codes[p] = len(vocab)
+                    vocab.append(p)
+                ts.append(float(m["ts"]))
+                authors.append(codes[author])
+                people.append(codes[p])
+                values.append(totals)
+
+        return cls(
+            np.array(ts, dtype=np.float64),
+            np.array(authors, dtype=np.int64),
+            np.array(people, dtype=np.int64),
+            np.array(values, dtype=np.float64).reshape(-1, len(METRICS)),
+            vocab
+        )
+
+    @classmethod
+    def from_columns(cls, ts, authors, values, mentions, offsets, vocab, users=None):
+        # Same rows as from_messages, built from pre-extracted per-message columns;
+        # author code -1 marks a message that has no author or no text
+        counts = np.diff(offsets) + 1
+        rows = np.repeat(np.arange(len(ts)), counts)
+        people = np.empty(len(rows), dtype=np.int64)
+        firsts = np.cumsum(counts) - counts
+        is_author = np.zeros(len(rows), dtype=bool)
+        is_author[firsts] = True
+        people[is_author] = authors
+        people[~is_author] = mentions
+        row_authors = authors[rows]
+
+        if users is not None:
+            vocab_out = list(users)
+            codes = {u: i for i, u in enumerate(vocab_out)}
+            lookup = np.array([codes.get(u, -1) for u in vocab] + [-1], dtype=np.int64)
+            row_authors, people = lookup[row_authors], lookup[people]
+        else:
+            vocab_out = list(vocab)
+        keep = (row_authors >= 0) & (people >= 0)
+        return cls(
+            ts[rows][keep].astype(np.float64),
+            row_authors[keep],
+            people[keep],
+            values[rows][keep].astype(np.float64).reshape(-1, len(METRICS)),
+            vocab_out
+        )
+
+    def window(self, start=None, end=None):
+        mask = np.ones(len(self.ts), dtype=bool)
+        if start is not None:
+            mask &= self.ts >= start
+        if end is not None:
+            mask &= self.ts <= end
+        return mask
+
+    def group_sum(self, keys, size, mask):
+        out = np.zeros((size, len(METRICS)), dtype=np.float64)
+        np.add.at(out, keys[mask], self.values[mask])
+        return out
+
+    def by_user(self, start=None, end=None):
+        return self.group_sum(self.people, len(self.vocab), self.window(start, end))
+
+    def week_starts(self, timezone):
+        # Step back in local calendar days, so a DST change inside the week can't land on Sunday
+        local = pd.to_datetime(self.ts, unit="s", utc=True).tz_convert(timezone).tz_localize(None)
+        monday = (local.normalize() - pd.to_timedelta(local.weekday, unit="D")).tz_localize(timezone)
+        return ((monday - pd.Timestamp(0, tz="UTC")) / pd.Timedelta(seconds=1)).to_numpy(dtype=np.float64)
@@ -1,9 +1,13 @@
 # app.py
 import os
+import threading
 from zoneinfo import ZoneInfo
 from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
 from bot import Bot, Leaderboard 
+from store import open_store, MemoryStore
+from jobs import JobQueue
+from clients import get_client
 
 SLACK_BOT_TOKEN = os.getenv("SLACK_TOKEN_25_26")      
 SLACK_APP_TOKEN = os.getenv("APP_TOKEN")      
@@ -12,65 +16,84 @@ CAPTAINS_CHANNEL = os.getenv("CAPTAINS_CHANNEL")
 TEAM_TZ = ZoneInfo("America/New_York")
 
 
-slack_app = App(token=SLACK_BOT_TOKEN)
-bot = Bot(SLACK_BOT_TOKEN, TEAM_TZ)
-leaderboard = Leaderboard(SLACK_BOT_TOKEN, WORKOUT_CHANNEL, CAPTAINS_CHANNEL, TEAM_TZ)
+slack_client = get_client(SLACK_BOT_TOKEN)
+slack_app = App(client=slack_client)
+store = MemoryStore(open_store())
+leaderboard = Leaderboard(SLACK_BOT_TOKEN, WORKOUT_CHANNEL, CAPTAINS_CHANNEL, TEAM_TZ, store, slack_client)
+bot = Bot(SLACK_BOT_TOKEN, TEAM_TZ, store, leaderboard.rollup, slack_client)
+jobs = JobQueue()
 
-@slack_app.command("/getleaderboard")
-def get_leaderboard(ack, body, say, client):
-    ack() 
+caught_up = False
+catch_up_lock = threading.Lock()
+
+def catch_up():
+    # Catch up on anything posted while the app was down; after that the store follows live message events.
+    # A failed catch-up is retried by the next command rather than failing every command after it
+    global caught_up
+    with catch_up_lock:
+        if not caught_up:
+            bot.sync(WORKOUT_CHANNEL, 7)
+            caught_up = True
 
+def show_leaderboard(channel_id):
+    catch_up()
+    leaderboard.display_leaderboard(channel_id)
+    leaderboard.flush()
+
+def show_requirements(channel_id):
+    catch_up()
+    leaderboard.remind_users(channel_id)
+    leaderboard.flush()
+
+def enqueue(name, run, done, body, say, client):
     user_id = body["user_id"]
     channel_id = body["channel_id"]
-        
-    if channel_id.startswith("D") or channel_id == CAPTAINS_CHANNEL:
-        try:
-            df = bot.paginate(WORKOUT_CHANNEL, 7)
-            bot.write(df)
-            leaderboard.display_leaderboard(channel_id)
-            say(f"<@{user_id}>, leaderboard displayed")
-        except Exception as e:
-            client.chat_postEphemeral(
-                channel=channel_id,
-                user=user_id,
-                text=f"Error displaying leaderboard: `{e}`"
-            )
-    else:
+
+    if not (channel_id.startswith("D") or channel_id == CAPTAINS_CHANNEL):
         client.chat_postEphemeral(
             channel=channel_id,
             user=user_id,
             text="This command only works in DMs"
         )
+        return
 
-@slack_app.command("/getrequirements")
-def get_leaderboard(ack, body, say, client):
-    ack() 
-
-    user_id = body["user_id"]
-    channel_id = body["channel_id"]
+    future, started = jobs.submit((name, channel_id), lambda: run(channel_id))
+    client.chat_postEphemeral(
+        channel=channel_id,
+        user=user_id,
+        text="Working on it…" if started else "Already working on that, I'll ping you when it's done…"
+    )
 
-    if channel_id.startswith("D") or channel_id == CAPTAINS_CHANNEL:
-        try:
-            df = bot.paginate(WORKOUT_CHANNEL, 7)
-            bot.write(df)
-            leaderboard.remind_users(channel_id, 'throw')
-            leaderboard.remind_users(channel_id, 'lift')
-            leaderboard.remind_users(channel_id, 'workout')
-            say(f"<@{user_id}>, requirements displayed")
-        except Exception as e:
+    def report(future):
+        error = future.exception()
+        if error is None:
+            say(f"<@{user_id}>, {done}")
+        else:
             client.chat_postEphemeral(
                 channel=channel_id,
                 user=user_id,
-                text=f"Error displaying leaderboard: `{e}`"
+                text=f"Error displaying leaderboard: `{error}`"
             )
-    else:
-        client.chat_postEphemeral(
-            channel=channel_id,
-            user=user_id,
-            text="This command only works in DMs"
-        )
+    future.add_done_callback(report)
+
+@slack_app.event("message")
+def on_message(event):
+    if event.get("channel") == WORKOUT_CHANNEL:
+        bot.apply_event(event)
+
+@slack_app.command("/getleaderboard")
+def get_leaderboard(ack, body, say, client):
+    ack() 
+    enqueue("leaderboard", show_leaderboard, "leaderboard displayed", body, say, client)
+
+@slack_app.command("/getrequirements")
+def get_requirements(ack, body, say, client):
+    ack() 
+    enqueue("requirements", show_requirements, "requirements displayed", body, say, client)
 
 if __name__ == "__main__":
     if not SLACK_BOT_TOKEN or not SLACK_APP_TOKEN:
         raise RuntimeError("Missing Slack tokens. Set SLACK_BOT_TOKEN and SLACK_APP_TOKEN.")
+    # Start catching up before the first command; commands wait on it and retry it if it failed
+    jobs.submit(("catch_up",), catch_up)
     SocketModeHandler(slack_app, SLACK_APP_TOKEN).start()
@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+from aggregate import MetricTable
+from scoring import METRICS, SIGNATURE, parse_text
+from store import COLUMNS, CsvStore
+
+class ColumnStore:
+
+    # Messages as .npz columns: float64 ts, dictionary-encoded user/thread_ts, utf-8 text as
+    # one byte buffer plus offsets, and the metrics parsed at write time. np.load only
+    # inflates the arrays that are touched, so metric queries never read the text.
+    def __init__(self, path="messages.npz"):
+        self.path = path
+
+    def columns(self, names=None):
+        if not os.path.exists(self.path):
+            return None
+        with np.load(self.path, allow_pickle=False) as archive:
+            cols = {name: archive[name] for name in (names or archive.files)}
+            # Metric columns parsed under a different tag table are ignored until the next write
+            cols["current"] = json.loads(archive["meta"].tobytes())["tags"] == SIGNATURE
+            return cols
+
+    def fingerprint(self):
+        cols = self.columns(["ts", "text_offsets"])
+        if cols is None or len(cols["ts"]) == 0:
+            return [0, None, 0]
+        return [len(cols["ts"]), f"{cols['ts'].max():.6f}", int(cols["text_offsets"][-1])]
+
+    def frame(self, cols, mask=None, parsed=False):
+        mask = np.ones(len(cols["ts"]), dtype=bool) if mask is None else mask
+        rows = np.flatnonzero(mask)
+        buffer, offsets = cols["text"].tobytes(), cols["text_offsets"]
+        users = np.append(cols["vocab"].astype(object), np.nan)
+        threads = np.append(cols["threads"].astype(object), np.nan)
+        df = pd.DataFrame({
+            "ts": [f"{ts:.6f}" for ts in cols["ts"][rows]],
+            "text": [np.nan if cols["text_null"][i] else buffer[offsets[i]:offsets[i + 1]].decode() for i in rows],
+            "user": users[cols["user"][rows]],
+            "thread_ts": threads[cols["thread_ts"][rows]],
+        }, columns=COLUMNS)
+        if parsed and cols["current"]:
+            # Rows carry what parse_text gave at write time, so a rewrite only parses incoming rows
+            vocab, starts = users.tolist(), cols["mention_offsets"]
+            df["parsed"] = [([vocab[p] for p in cols["mentions"][starts[i]:starts[i + 1]]], *cols["metrics"][i].tolist()) for i in rows]
+        return df
+
+    def window(self, ts, start=None, end=None):
+        mask = np.ones(len(ts), dtype=bool)
+        if start is not None:
+            mask &= ts >= start
+        if end is not None:
+            mask &= ts <= end
+        return mask
+
+    def load(self, start=None, end=None, parsed=False):
+        cols = self.columns()
+        if cols is None:
+            return pd.DataFrame(columns=COLUMNS)
+        return self.frame(cols, self.window(cols["ts"], start, end), parsed)
+
+    def table(self, scores=None, users=None, start=None, end=None):
+        cols = self.columns(["ts", "user", "vocab", "text_null", "metrics", "mentions", "mention_offsets"])
+        if cols is None or not cols["current"]:
+            return MetricTable.from_messages(self.load(start, end), scores, users)
+        mask = self.window(cols["ts"], start, end) & ~cols["text_null"]
+        offsets = cols["mention_offsets"]
+        starts, ends = offsets[:-1][mask], offsets[1:][mask]
+        mentions = np.concatenate([cols["mentions"][a:b] for a, b in zip(starts, ends)] or [np.empty(0, dtype=np.int32)])
+        return MetricTable.from_columns(
+            cols["ts"][mask],
+            cols["user"][mask].astype(np.int64),
+            cols["metrics"][mask],
+            mentions.astype(np.int64),
+            np.concatenate([[0], np.cumsum(ends - starts)]),
+            [str(u) for u in cols["vocab"]],
+            users
+        )
+
+    def save(self, df):
+        df = df.sort_values("ts", key=lambda ts: ts.astype(float), kind="stable")
+        vocab, threads = {}, {}
+        user_codes, thread_codes, metrics, mentions, mention_offsets = [], [], [], [], [0]
+        text, text_offsets, text_null = bytearray(), [0], []
+        for m in df.to_dict("records"):
+            has_text, has_user = isinstance(m["text"], str), isinstance(m["user"], str)
+            user_codes.append(vocab.setdefault(m["user"], len(vocab)) if has_user else -1)
+            thread = m.get("thread_ts")
+            thread_codes.append(threads.setdefault(thread, len(threads)) if isinstance(thread, str) else -1)
+            text_null.append(not has_text)
+            if has_text:
+                text += m["text"].encode()
+            text_offsets.append(len(text))
+            if isinstance(m.get("parsed"), tuple):
+                people, *totals = m["parsed"]
+            else:
+                people, *totals = parse_text(m["text"]) if has_text else ([], *[0] * len(METRICS))
+            if has_text and has_user:
+                mentions += [vocab.setdefault(p, len(vocab)) for p in people]
+            mention_offsets.append(len(mentions))
+            metrics.append(totals)
+
+        meta = json.dumps({"tags": SIGNATURE, "metrics": METRICS}).encode()
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(
+                f,
+                meta=np.frombuffer(meta, dtype=np.uint8),
+                ts=df["ts"].astype(float).to_numpy(dtype=np.float64),
+                user=np.array(user_codes, dtype=np.int32),
+                vocab=np.array(list(vocab), dtype=str),
+                thread_ts=np.array(thread_codes, dtype=np.int32),
+                threads=np.array(list(threads), dtype=str),
+                text=np.frombuffer(bytes(text), dtype=np.uint8),
+                text_offsets=np.array(text_offsets, dtype=np.int64),
+                text_null=np.array(text_null, dtype=bool),
+                metrics=np.array(metrics, dtype=np.float64).reshape(-1, len(METRICS)),
+                mentions=np.array(mentions, dtype=np.int32),
+                mention_offsets=np.array(mention_offsets, dtype=np.int64),
+            )
+        os.replace(tmp, self.path)
+
+    def upsert(self, df2):
+        df1 = self.load(parsed=True)
+        if df2.empty:
+            logging.info("No new messages to write")
+            self.save(df1)
+            return 0, 0
+
+        df2 = df2.drop_duplicates(subset=["ts"], keep="last").reindex(columns=COLUMNS)
+        old = dict(zip(df1["ts"], df1["text"]))
+        is_new = ~df2["ts"].isin(old.keys())
+        old_text = df2["ts"].map(old)
+        changed = is_new | ((old_text != df2["text"]) & ~(old_text.isna() & df2["text"].isna()))
+        new_msgs, updates = int(is_new.sum()), int((changed & ~is_new).sum())
+
+        merged = pd.concat([df1[~df1["ts"].isin(df2["ts"][changed])], df2[changed]], ignore_index=True)
+        logging.info(f"{len(df1)} rows -> {len(merged)} rows ({new_msgs} new, {updates} edits updated)")
+        self.save(merged)
+        return new_msgs, updates
+
+    def delete(self, ts_values):
+        df = self.load(parsed=True)
+        keep = ~df["ts"].isin(list(ts_values))
+        removed = int((~keep).sum())
+        if removed:
+            self.save(df[keep])
+            logging.info(f"{removed} deleted messages removed")
+        return removed
+
+    def migrate(self, csv_path="messages.csv"):
+        df = CsvStore(csv_path).load()
+        logging.info(f"Migrating {len(df)} rows from {csv_path} to {self.path}")
+        return self.upsert(df)
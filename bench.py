@@ -0,0 +1,227 @@
+import logging
+
+# Quiet the bot's own logging before it is imported, so the run doesn't touch slack_bot.log
+logging.basicConfig(level=logging.WARNING, handlers=[logging.NullHandler()])
+
+import argparse
+import bisect
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from zoneinfo import ZoneInfo
+from PIL import Image, ImageDraw
+from bot import Bot
+from leaderboard import Leaderboard
+from ratelimit import TokenBucket
+from scoring import TAGS
+from store import open_store
+
+TEAM_TZ = ZoneInfo("America/New_York")
+CHANNEL = "CBENCH"
+# Roughly one season of the workouts channel
+BASE_MESSAGES = 3200
+BASE_USERS = 26
+SEASON_DAYS = 120
+# Stages whose work grows with the message count; the rest scale with the roster
+PER_MESSAGE = {"paginate", "write", "get_metrics"}
+# Seconds to import bot.py in a fresh interpreter; none of HEAVY should load until a run needs it
+STARTUP_BUDGET = .5
+HEAVY = ("pandas", "numpy", "matplotlib", "PIL")
+
+class Workspace:
+
+    # A synthetic workouts channel: parents newest first, some with a thread of replies
+    def __init__(self, messages, users=BASE_USERS, thread_depth=3, thread_rate=.2, tag_density=.8, days=SEASON_DAYS, seed=0):
+        rng = random.Random(seed)
+        self.users = {f"U{i:05d}": f"Player {i}" for i in range(users)}
+        self.start = time.time() - days * 24 * 3600
+        uids, tags = list(self.users), list(TAGS)
+        step = days * 24 * 3600 / max(messages, 1)
+
+        def text():
+            parts = []
+            while rng.random() < tag_density:
+                tag = rng.choice(tags)
+                parts.append(f"!{tag} {rng.randint(10, 90)}" if TAGS[tag][1] is None else f"!{tag}")
+            if rng.random() < .3:
+                parts.append(f"<@{rng.choice(uids)}>")
+            return " ".join(parts) or "rest day"
+
+        self.parents, self.replies = [], {}
+        made, clock = 0, self.start
+        while made < messages:
+            clock += step
+            ts = f"{clock:.6f}"
+            parent = {"type": "message", "user": rng.choice(uids), "text": text(), "ts": ts}
+            made += 1
+            if rng.random() < thread_rate and made < messages:
+                depth = min(rng.randint(1, thread_depth), messages - made)
+                replies = [{"type": "message", "user": rng.choice(uids), "text": text(), "ts": f"{clock + r + 1:.6f}", "thread_ts": ts}
+                           for r in range(depth)]
+                parent.update(thread_ts=ts, reply_count=depth, latest_reply=replies[-1]["ts"])
+                self.replies[ts] = [dict(parent)] + replies
+                made += depth
+                # Replies use up their share of the season too, so the channel spans all of it
+                clock += depth * step
+            self.parents.append(parent)
+        self.parents.reverse()
+        self.order = [-float(p["ts"]) for p in self.parents]
+
+class FakeClient:
+
+    # Serves a Workspace through the handful of Web API methods the bot calls, counting each call
+    def __init__(self, workspace):
+        self.workspace = workspace
+        self.calls = {}
+        self.uploaded = 0
+        self.files = {}
+
+    def count(self, method):
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+    def conversations_history(self, channel, cursor=None, oldest=None, limit=100, **kwargs):
+        self.count("conversations.history")
+        # Parents are newest first, so everything after oldest is a prefix
+        end = len(self.workspace.parents) if oldest is None else bisect.bisect_left(self.workspace.order, -float(oldest))
+        offset = int(cursor or 0)
+        page = self.workspace.parents[offset:min(offset + limit, end)]
+        more = offset + limit < end
+        return {"ok": True, "messages": page, "has_more": more, "response_metadata": {"next_cursor": str(offset + limit) if more else ""}}
+
+    def conversations_replies(self, channel, ts, **kwargs):
+        self.count("conversations.replies")
+        return {"ok": True, "messages": self.workspace.replies.get(ts, [])}
+
+    def files_upload_v2(self, channel, content=None, file=None, filename=None, **kwargs):
+        self.count("files.upload_v2")
+        file_id = f"F{len(self.files):06d}"
+        self.uploaded += len(content) if content is not None else os.path.getsize(file)
+        self.files[file_id] = {"id": file_id, "shares": {"public": {channel: [{"ts": f"{time.time():.6f}"}]}}}
+        return {"ok": True, "files": [{"id": file_id}]}
+
+    def files_info(self, file, **kwargs):
+        self.count("files.info")
+        return {"ok": True, "file": self.files[file]}
+
+    def chat_postMessage(self, channel, text, **kwargs):
+        self.count("chat.postMessage")
+        return {"ok": True, "ts": f"{time.time():.6f}"}
+
+def make_avatars(users, folder="profiles"):
+    os.makedirs(folder, exist_ok=True)
+    for i, uid in enumerate(users):
+        img = Image.new("RGBA", (512, 512), (0, 0, 0, 0))
+        ImageDraw.Draw(img).ellipse((0, 0, 511, 511), fill=(37 * i % 256, 91 * i % 256, 173 * i % 256, 255))
+        img.save(os.path.join(folder, f"{uid}.png"))
+
+def run(workspace, stages, traced=False):
+    # Each scale runs in a scratch directory, since the bot keeps its state in the working directory
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            users = workspace.users
+            with open("people.json", "w") as f:
+                json.dump(users, f)
+            make_avatars(users)
+
+            client = FakeClient(workspace)
+            store = open_store("messages.csv")
+            leaderboard = Leaderboard("xoxb-bench", CHANNEL, CHANNEL, TEAM_TZ, store, client)
+            bot = Bot("xoxb-bench", TEAM_TZ, store, leaderboard.rollup, client)
+            # The fake has no rate limits, so the buckets shouldn't add waits of their own
+            bot.history_limit = TokenBucket(10 ** 9, burst=10 ** 9)
+            bot.replies_limit = TokenBucket(10 ** 9, burst=10 ** 9)
+            days = (time.time() - workspace.start) / (24 * 3600) + 1
+            info = {"start": workspace.start}
+            state = {}
+
+            steps = {
+                "paginate": lambda: state.update(df=bot.paginate(CHANNEL, days, 200)),
+                "write": lambda: bot.write(state["df"]),
+                "get_metrics": lambda: state.update(metrics=leaderboard.get_metrics(users, info, combine_gym=True)),
+                "display": lambda: state.update(plot=leaderboard.display(state["metrics"], users, 0)[1]),
+                "get_progress": lambda: leaderboard.get_progress(state["metrics"], users),
+                "upload": lambda: (leaderboard.post_message("Benchmark", CHANNEL, None, state["plot"], "plot.jpg"), leaderboard.flush()),
+            }
+            for name in stages:
+                if traced:
+                    tracemalloc.start()
+                begin = time.perf_counter()
+                steps[name]()
+                elapsed = time.perf_counter() - begin
+                peak = tracemalloc.get_traced_memory()[1] if traced else None
+                if traced:
+                    tracemalloc.stop()
+                results[name] = (elapsed, peak)
+            calls = dict(client.calls)
+        finally:
+            os.chdir(cwd)
+    return results, calls
+
+def startup(module="bot", runs=5):
+    # Best of several cold interpreters, run from a scratch directory so bot.py's log lands there
+    code = (f"import sys, time; begin = time.perf_counter(); import {module}; "
+            f"print(time.perf_counter() - begin); print(' '.join(m for m in {HEAVY!r} if m in sys.modules))")
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    best, loaded = None, ""
+    with tempfile.TemporaryDirectory() as scratch:
+        for _ in range(runs):
+            out = subprocess.run([sys.executable, "-c", code], cwd=scratch, env=env, capture_output=True, text=True, check=True).stdout.splitlines()
+            seconds = float(out[0])
+            best = seconds if best is None else min(best, seconds)
+            loaded = out[1] if len(out) > 1 else ""
+    return best, loaded.split()
+
+def report(scale, messages, calls, timed, traced):
+    print(f"\n{scale}x ({messages} messages) - calls: {calls}")
+    print(f"{'stage':<14}{'seconds':>10}{'msgs/s':>14}{'peak MB':>10}")
+    for name, (elapsed, _) in timed.items():
+        peak = traced[name][1] / 2 ** 20 if traced else float("nan")
+        rate = f"{messages / elapsed:.0f}" if name in PER_MESSAGE and elapsed else "-"
+        print(f"{name:<14}{elapsed:>10.3f}{rate:>14}{peak:>10.1f}")
+
+if __name__ == "__main__":
+    # python bench.py [--scales 1 10 100] [--users 26] [--thread-depth 3] [--tag-density .8] [--json bench.json]
+    parser = argparse.ArgumentParser(description="Time the bot against a synthetic workspace")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--messages", type=int, default=BASE_MESSAGES, help="messages at 1x")
+    parser.add_argument("--users", type=int, default=BASE_USERS)
+    parser.add_argument("--thread-depth", type=int, default=3)
+    parser.add_argument("--thread-rate", type=float, default=.2)
+    parser.add_argument("--tag-density", type=float, default=.8)
+    parser.add_argument("--stages", nargs="+", default=["paginate", "write", "get_metrics", "display", "get_progress", "upload"])
+    parser.add_argument("--no-memory", action="store_true", help="skip the second, tracemalloc-instrumented pass")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--startup", action="store_true", help="only check the cold-start budget for importing bot.py")
+    args = parser.parse_args()
+
+    if args.startup:
+        seconds, loaded = startup()
+        print(f"import bot: {seconds:.3f}s (budget {STARTUP_BUDGET}s), heavy modules loaded: {', '.join(loaded) or 'none'}")
+        sys.exit(0 if seconds <= STARTUP_BUDGET and not loaded else 1)
+
+    summary = {}
+    for scale in args.scales:
+        messages = args.messages * scale
+        workspace = Workspace(messages, args.users, args.thread_depth, args.thread_rate, args.tag_density)
+        # Timings come from an untraced pass; tracemalloc slows allocation-heavy stages down
+        timed, calls = run(workspace, args.stages)
+        traced = None if args.no_memory else run(workspace, args.stages, traced=True)[0]
+        report(scale, messages, calls, timed, traced)
+        summary[scale] = {
+            "messages": messages,
+            "calls": calls,
+            "stages": {name: {"seconds": timed[name][0], "peak_bytes": traced[name][1] if traced else None} for name in args.stages},
+        }
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"run": datetime.datetime.now(TEAM_TZ).isoformat(), "results": summary}, f, indent=2)
@@ -9,102 +9,259 @@ logging.info("Slack bot started")
 
 import os
 from dotenv import load_dotenv
-from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
-import time
 import datetime
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from zoneinfo import ZoneInfo 
-import pandas as pd
 from leaderboard import Leaderboard
+from ratelimit import TokenBucket, TIER_3, call
+from store import open_store
+from clients import get_client
+from instrument import recorder
+from lazy import lazy
+
+pd = lazy("pandas")
 
 load_dotenv()
 
 class Bot:
 
-    def __init__(self, bot_token, timezone):
+    STATE = "sync.json"
+    WORKERS = 4
+    # Reconcile refuses to delete more than this in one run; a short listing shouldn't wipe the season
+    MAX_DELETES = 50
+
+    def __init__(self, bot_token, timezone, store=None, rollup=None, client=None):
         self.TOKEN = bot_token
         self.TZ = timezone
+        self.client = client or get_client(bot_token)
+        self.store = store or open_store()
+        self.rollup = rollup
+        self.history_limit = TokenBucket(TIER_3)
+        self.replies_limit = TokenBucket(TIER_3)
+
+    def fetch_threads(self, client, channel_id, thread_tss):
+        def replies(ts):
+            response = call(self.replies_limit, client.conversations_replies, channel=channel_id, ts=ts)
+            return [{"text": old['text'], "user": old['user'], "ts": old['ts'], "thread_ts": old['thread_ts']}
+                    for old in response["messages"] if "user" in old]
+
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            return [msg for thread in pool.map(replies, thread_tss) for msg in thread]
 
     def get_selfies_messages(self, channel_id, days=7, limit=200, cursor=None):
-        client = WebClient(token=self.TOKEN)
+        client = self.client
         try:
             start = (datetime.datetime.now(self.TZ) - datetime.timedelta(days=days)).timestamp()
-            all_msgs = []
-            response = client.conversations_history(
+            all_msgs, thread_tss = [], []
+            response = call(
+                self.history_limit,
+                client.conversations_history,
                 cursor=cursor,
                 oldest=start,
                 limit=limit,
                 channel=channel_id
             )
-            count = 0
             for message in response['messages']:
                 if 'thread_ts' in message:
-                    count += 1
-                    thread_response = client.conversations_replies(channel=channel_id, ts=message['thread_ts'])
-                    for old in thread_response["messages"]:
-                        if "user" in old:
-                            all_msgs.append({"text": old['text'], "user": old['user'], "ts": old['ts'], "thread_ts": old['thread_ts']})
+                    thread_tss.append(message['thread_ts'])
                 elif "user" in message:
                     all_msgs.append({"text": message['text'], "user": message['user'], "ts": message['ts']})
-            logging.info(f"{count} threads processed, {len(all_msgs)} messages retrieved")
+            all_msgs += self.fetch_threads(client, channel_id, thread_tss)
+            logging.info(f"{len(thread_tss)} threads processed, {len(all_msgs)} messages retrieved")
             return pd.DataFrame(all_msgs, dtype=str), response
         except SlackApiError as e:
             logging.error(f"Slack API error: {e}")
             return pd.DataFrame(), {}
 
-    def write(self, df2):
-        file_path = os.path.join(os.getcwd(), "messages.csv")
-
-        if os.path.exists(file_path):
-            df1 = pd.read_csv(file_path, dtype=str)
-        else:
-            df1 = pd.DataFrame(columns=df2.columns)
-
-        if df2.empty:
-            logging.info("No new messages to write")
-            df1.to_csv(file_path, index=False)
-            return
-
-        old_length = len(df1)
-
-        for col in df2.columns:
-            if col not in df1.columns:
-                df1[col] = None
-        for col in df1.columns:
-            if col not in df2.columns:
-                df2[col] = None
-
-        df1 = df1.set_index("ts")
-        df2 = df2.set_index("ts")
-        updates, new_msgs = 0, 0
+    def guard(self):
+        # Writes hold the rollup's lock, so command jobs never total a half-updated rollup
+        return self.rollup.lock if self.rollup is not None else nullcontext()
 
-        for ts, row in df2.iterrows():
-            if ts not in df1.index: # New msg
-                df1.loc[ts] = row
-                new_msgs += 1
-            else: # Existing msg
-                old_text = df1.loc[ts]["text"]
-                new_text = row["text"]
-                if old_text != new_text:
-                    df1.loc[ts] = row 
-                    updates += 1
+    def write(self, df2):
+        with self.guard():
+            if self.rollup is not None:
+                # The saved rollup is checked against the store before this write moves its fingerprint
+                self.rollup.load()
+            with recorder.stage("merge"):
+                new_msgs, updates = self.store.upsert(df2)
+            if self.rollup is not None and new_msgs + updates > 0:
+                with recorder.stage("aggregate"):
+                    self.rollup.update(df2["ts"])
+        return new_msgs, updates
 
-        df1 = df1.reset_index()
-        df1 = df1.drop_duplicates(subset=["ts"], keep="last")
+    def delete(self, ts_values):
+        with self.guard():
+            if self.rollup is not None:
+                self.rollup.load()
+            removed = self.store.delete(ts_values)
+            if self.rollup is not None and removed:
+                self.rollup.update(ts_values)
+        return removed
 
-        logging.info(f"{old_length} rows -> {len(df1)} rows " f"({new_msgs} new, {updates} edits updated)")
-        df1.to_csv(file_path, index=False)
+    def apply_event(self, event):
+        subtype = event.get("subtype")
+        if subtype == "message_deleted":
+            return self.delete([event["deleted_ts"]])
 
+        message = event["message"] if subtype == "message_changed" else event
+        if "user" not in message:
+            return
+        msg = {"text": message.get('text', ""), "user": message['user'], "ts": message['ts']}
+        if 'thread_ts' in message:
+            msg["thread_ts"] = message['thread_ts']
+        return self.write(pd.DataFrame([msg], dtype=str))
 
     def paginate(self, channel_id, days=7, limit=100):
         df, response = self.get_selfies_messages(channel_id, days, limit)
         while response.get('has_more'):
-            time.sleep(30)
             df2, response = self.get_selfies_messages(channel_id, days, limit, response['response_metadata']['next_cursor'])
             df = pd.concat([df, df2], ignore_index=True)
                 
         return df
 
+    def load_state(self):
+        if os.path.exists(self.STATE):
+            with open(self.STATE, "r") as f:
+                return json.load(f)
+        return {"latest": None, "threads": {}}
+
+    def save_state(self, state):
+        with open(self.STATE, "w") as f:
+            json.dump(state, f)
+
+    def sync(self, channel_id, days=3, limit=200):
+        # Replies don't bump their parent, so parents inside the window are still listed,
+        # but only threads whose reply_count/latest_reply moved get conversations_replies
+        client = self.client
+        state = self.load_state()
+        mark = float(state["latest"]) if state["latest"] else None
+        oldest = (datetime.datetime.now(self.TZ) - datetime.timedelta(days=days)).timestamp()
+        if mark is not None:
+            oldest = min(oldest, mark)
+
+        all_msgs, threads, changed, latest = [], {}, [], state["latest"]
+        with recorder.stage("fetch"):
+            cursor, complete = None, False
+            try:
+                while True:
+                    response = call(self.history_limit, client.conversations_history, cursor=cursor, oldest=oldest, limit=limit, channel=channel_id)
+                    for message in response['messages']:
+                        if latest is None or float(message['ts']) > float(latest):
+                            latest = message['ts']
+                        is_new = mark is None or float(message['ts']) > mark or 'edited' in message
+
+                        if message.get('thread_ts') == message['ts']:
+                            seen = [message.get('reply_count', 0), message.get('latest_reply', message['thread_ts'])]
+                            threads[message['thread_ts']] = seen
+                            if state["threads"].get(message['thread_ts']) != seen:
+                                changed.append(message['thread_ts'])
+                                continue
+                        if is_new and "user" in message:
+                            msg = {"text": message['text'], "user": message['user'], "ts": message['ts']}
+                            if 'thread_ts' in message:
+                                msg["thread_ts"] = message['thread_ts']
+                            all_msgs.append(msg)
+
+                    if not response.get('has_more'):
+                        break
+                    cursor = response['response_metadata']['next_cursor']
+
+                all_msgs += self.fetch_threads(client, channel_id, changed)
+                complete = True
+            except SlackApiError as e:
+                logging.error(f"Slack API error: {e}")
+
+        logging.info(f"Sync since {oldest}: {len(changed)} changed threads fetched, {len(all_msgs)} messages retrieved")
+        self.write(pd.DataFrame(all_msgs, dtype=str))
+
+        if complete:
+            state.update(latest=latest, threads=threads)
+            self.save_state(state)
+
+    def reconcile(self, channel_id, since=None, limit=200):
+        # Walks only the parent list back to the season start. Parents are rewritten when new or edited,
+        # threads are re-fetched only when reply_count/latest_reply moved since they were last seen,
+        # and whatever Slack no longer lists is deleted (tombstoned in the CSV store)
+        if since is None:
+            with open("info.json", "r") as f:
+                since = json.load(f)["start"]
+        client = self.client
+        state = self.load_state()
+        # reply_count/latest_reply count app and webhook replies the store never keeps, so threads are
+        # compared with the metadata the last reconcile saw; the stored replies are only a first-run fallback
+        seen = state.get("season", {})
+        stored = self.store.load(since)
+        texts = dict(zip(stored["ts"], stored["text"]))
+        top = stored["thread_ts"].isna() | (stored["thread_ts"] == stored["ts"])
+        replies = stored[~top].groupby("thread_ts")["ts"].agg(list).to_dict()
+
+        listed, threads, changed, upserts, horizon = set(), {}, [], [], None
+        with recorder.stage("fetch"):
+            cursor = None
+            try:
+                while True:
+                    response = call(self.history_limit, client.conversations_history, cursor=cursor, oldest=since, limit=limit, channel=channel_id)
+                    for message in response['messages']:
+                        ts, thread_ts = message['ts'], message.get('thread_ts')
+                        if thread_ts not in (None, ts):
+                            continue # a reply broadcast to the channel is covered by its thread
+                        horizon = ts if horizon is None else min(horizon, ts, key=float)
+                        if thread_ts == ts:
+                            # A deleted parent with replies stays listed as a tombstone without a user
+                            threads[ts] = [message.get('reply_count', 0), message.get('latest_reply', ts)]
+                            have = replies.get(ts, [])
+                            known = seen.get(ts, [len(have), max(have, key=float) if have else ts])
+                            if known != threads[ts]:
+                                changed.append(ts)
+                        if "user" not in message:
+                            continue
+                        listed.add(ts)
+                        if ts not in texts or ('edited' in message and texts[ts] != message['text']):
+                            msg = {"text": message['text'], "user": message['user'], "ts": ts}
+                            if thread_ts:
+                                msg["thread_ts"] = thread_ts
+                            upserts.append(msg)
+
+                    if not response.get('has_more'):
+                        break
+                    cursor = response['response_metadata']['next_cursor']
+                fetched = self.fetch_threads(client, channel_id, changed)
+            except SlackApiError as e:
+                # Without the full listing a missing message can't be told from a failed page
+                logging.error(f"Slack API error: {e}")
+                return None
+
+        upserts += fetched
+        fetched_ts = {msg["ts"] for msg in fetched}
+        # Nothing older than the oldest listed parent can be told apart from history Slack no longer
+        # shows (e.g. the free plan's 90 days), so deletions stop there
+        horizon = float(horizon) if horizon is not None else float("inf")
+        deleted = [ts for ts in stored.loc[top, "ts"] if ts not in listed and float(ts) >= horizon]
+        for thread_ts, ts_values in replies.items():
+            if float(thread_ts) < max(since, horizon):
+                continue # the parent predates the listing, so it was never seen
+            if thread_ts not in threads:
+                deleted += ts_values
+            elif thread_ts in changed:
+                deleted += [ts for ts in ts_values if ts not in fetched_ts]
+        if len(deleted) > self.MAX_DELETES:
+            logging.error(f"Reconcile would delete {len(deleted)} of {len(stored)} stored messages "
+                          f"(limit {self.MAX_DELETES}); skipping deletions, check the channel history")
+            deleted = []
+            # Changed threads are checked again next run rather than marked as seen
+            threads = {ts: meta for ts, meta in threads.items() if ts not in changed}
+
+        new_msgs, updates = self.write(pd.DataFrame(upserts, dtype=str))
+        removed = self.delete(deleted) if deleted else 0
+        state["season"] = threads
+        self.save_state(state)
+        logging.info(f"Reconciled since {since}: {len(listed)} parents listed, {len(changed)} threads re-fetched, "
+                     f"{new_msgs} new, {updates} edited, {removed} deleted")
+        return new_msgs, updates, removed
+
 if __name__ == "__main__":
 
     TOKEN = os.getenv("SLACK_TOKEN_25_26")
@@ -119,21 +276,32 @@ if __name__ == "__main__":
     if not WORKOUT_CHANNEL:
         raise ValueError("SLACK_CHANNEL_ID is missing!")
     
-    bot = Bot(TOKEN, TEAM_TZ)
-    leaderboard = Leaderboard(TOKEN, WORKOUT_CHANNEL, CAPTAINS_CHANNEL, TEAM_TZ)
+    store = open_store()
+    client = get_client(TOKEN)
+    leaderboard = Leaderboard(TOKEN, WORKOUT_CHANNEL, CAPTAINS_CHANNEL, TEAM_TZ, store, client)
+    bot = Bot(TOKEN, TEAM_TZ, store, leaderboard.rollup, client)
 
     try:
-        df = bot.paginate(WORKOUT_CHANNEL, 3)
-        bot.write(df)
+        bot.sync(WORKOUT_CHANNEL, 3)
         weekday = datetime.datetime.today().weekday()
         if weekday == 5: # Saturday
-            leaderboard.remind_users(WORKOUT_CHANNEL, 'throw')
-            leaderboard.remind_users(WORKOUT_CHANNEL, 'lift')
-            leaderboard.remind_users(WORKOUT_CHANNEL, 'workout')
+            leaderboard.remind_users(WORKOUT_CHANNEL)
         if weekday == 0: # Monday
+            # Catch edits and deletions anywhere in the season before the leaderboard goes out
+            bot.reconcile(WORKOUT_CHANNEL)
             leaderboard.display_leaderboard(WORKOUT_CHANNEL)
             leaderboard.report_captains(CAPTAINS_CHANNEL)
+        leaderboard.flush()
         logging.info("Slack bot run completed successfully")
     except Exception as e:
         logging.error(f"Error running bot: {e}")
         raise
+    finally:
+        # Sync-only days parse new messages through the rollup without reaching get_metrics
+        leaderboard.scores.save()
+        recorder.cache("scores", leaderboard.scores.hits, leaderboard.scores.misses)
+        recorder.cache("charts", leaderboard.charts.hits, leaderboard.charts.misses)
+        recorder.write()
+        summary = recorder.summary()
+        logging.info(f"Run summary\n{summary}")
+        print(summary)
@@ -0,0 +1,106 @@
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+from instrument import recorder
+from lazy import lazy
+
+mcolors = lazy("matplotlib.colors")
+figure = lazy("matplotlib.figure")
+np = lazy("numpy")
+
+def progress_cmap():
+    return mcolors.LinearSegmentedColormap.from_list(
+        "progress_cmap",
+        [(0.0, "red"),
+        (0.4, "red"),
+        (0.8, "yellow"),
+        (1.0, "green")])   # ends green
+
+def to_jpg(fig):
+    # Rendered in memory; callers get immutable bytes, so a cached image can be uploaded by several requests at once
+    buf = io.BytesIO()
+    fig.savefig(buf, format="jpg")
+    return buf.getvalue()
+
+class ProgressChart:
+
+    # The gradients, frames and ticks are drawn once per set of scales; a render only moves
+    # the gray bars and relabels. Each scale is one panel, stacked top to bottom.
+    def __init__(self, *max_progs):
+        self.max_progs = max_progs
+        self.fig = figure.Figure(figsize=(6, 2 * len(max_progs)), dpi=200, layout='tight')
+        self.panels = [self.draw(ax, max_prog) for ax, max_prog in zip(self.fig.subplots(len(max_progs), 1, squeeze=False)[:, 0], max_progs)]
+
+    def draw(self, ax, max_prog):
+        grad = np.linspace(0, max_prog, 256).reshape(1, -1)
+        ax.imshow(
+            grad,
+            extent=[0, max_prog, -0.2, 0.2],
+            aspect="auto",
+            cmap=progress_cmap(),
+            norm=mcolors.Normalize(vmin=0, vmax=max_prog)
+        )
+
+        ax.barh([0], [max_prog], color="none", edgecolor="black", height=0.4)
+        remaining = ax.barh([0], [max_prog], left=0, color="lightgray", height=0.4)[0]
+
+        ax.set_xlim(0, max_prog)
+        ax.set_yticks([])
+        xticks = np.linspace(0, max_prog, 6)  # 6 ticks between 0 and 1.25
+        ax.set_xticks(xticks)
+        ax.set_xticklabels([f"{int(x*100)}%" for x in xticks])
+
+        title = ax.set_title("", fontsize=10)
+        # The label sits above the axes; a single chart lays it out past the edge, stacked panels would overlap it
+        label = ax.text(0.5, 0.7, "", ha="center", va="bottom", fontsize=9, clip_on=len(self.max_progs) > 1)
+        return remaining, title, label
+
+    def render(self, bars):
+        # bars: one (progress, title, label) per panel
+        for (remaining, title, label), max_prog, (progress, title_text, label_text) in zip(self.panels, self.max_progs, bars):
+            remaining.set_x(progress)
+            remaining.set_width(max_prog - progress)
+            title.set_text(title_text)
+            label.set_text(label_text)
+        return to_jpg(self.fig)
+
+class ChartCache:
+
+    def __init__(self, size=32):
+        self.size = size
+        self.entries = OrderedDict()
+        self.templates = {}
+        self.hits, self.misses = 0, 0
+        # matplotlib isn't thread-safe, so renders are serialized as well as cached
+        self.lock = threading.RLock()
+
+    def key(self, *parts):
+        return hashlib.blake2b(json.dumps(parts, default=str).encode(), digest_size=16).hexdigest()
+
+    def get(self, key, render):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            with recorder.stage("render"):
+                image = render()
+            self.entries[key] = image
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+            return image
+
+    def progress(self, progress, title, label, max_prog):
+        return self.panels([(progress, title, label, max_prog)])
+
+    def panels(self, bars):
+        # bars: (progress, title, label, max_prog) per panel, all drawn into one image
+        scales = tuple(bar[3] for bar in bars)
+        def render():
+            if scales not in self.templates:
+                self.templates[scales] = ProgressChart(*scales)
+            return self.templates[scales].render([bar[:3] for bar in bars])
+        return self.get(self.key("progress", *bars), render)
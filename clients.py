@@ -0,0 +1,20 @@
+import threading
+from slack_sdk import WebClient
+from slack_sdk.http_retry.builtin_handlers import ConnectionErrorRetryHandler, ServerErrorRetryHandler
+
+TIMEOUT = 30
+
+clients = {}
+lock = threading.Lock()
+
+def get_client(token, timeout=TIMEOUT):
+    # One configured client per token for the whole process. 429s are left to ratelimit.call,
+    # which backs off the shared token buckets rather than a single request.
+    with lock:
+        if token not in clients:
+            clients[token] = WebClient(
+                token=token,
+                timeout=timeout,
+                retry_handlers=[ConnectionErrorRetryHandler(max_retry_count=2), ServerErrorRetryHandler(max_retry_count=2)]
+            )
+        return clients[token]
@@ -0,0 +1,93 @@
+import datetime
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+LOG = "metrics.jsonl"
+
+class Recorder:
+
+    # Per-run counters shared by the whole process. Stages can nest (parse runs inside
+    # aggregate), so stage times overlap rather than adding up to the run's wall time.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.stages = {}
+            self.calls = {}
+            self.waits = [0, 0.0]
+            self.limited = {}
+            self.caches = {}
+
+    @contextmanager
+    def stage(self, name):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - begin
+            with self.lock:
+                entry = self.stages.setdefault(name, [0, 0.0])
+                entry[0] += 1
+                entry[1] += elapsed
+
+    def call(self, method, seconds, size):
+        with self.lock:
+            entry = self.calls.setdefault(method, [0, 0.0, 0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] += size
+
+    def wait(self, seconds):
+        with self.lock:
+            self.waits[0] += 1
+            self.waits[1] += seconds
+
+    def rate_limited(self, method):
+        with self.lock:
+            self.limited[method] = self.limited.get(method, 0) + 1
+
+    def cache(self, name, hits, misses):
+        with self.lock:
+            self.caches[name] = [hits, misses]
+
+    def records(self):
+        with self.lock:
+            run = datetime.datetime.fromtimestamp(self.started, datetime.timezone.utc).isoformat()
+            lines = [{"run": run, "type": "run", "seconds": time.time() - self.started}]
+            lines += [{"run": run, "type": "stage", "stage": name, "count": n, "seconds": s} for name, (n, s) in self.stages.items()]
+            lines += [{"run": run, "type": "api", "method": method, "count": n, "seconds": s, "bytes": b, "rate_limited": self.limited.get(method, 0)}
+                      for method, (n, s, b) in self.calls.items()]
+            lines.append({"run": run, "type": "wait", "count": self.waits[0], "seconds": self.waits[1]})
+            lines += [{"run": run, "type": "cache", "cache": name, "hits": h, "misses": m, "hit_rate": h / (h + m) if h + m else None}
+                      for name, (h, m) in self.caches.items()]
+        return lines
+
+    def write(self, path=LOG):
+        with open(path, "a") as f:
+            for line in self.records():
+                f.write(json.dumps(line) + "\n")
+
+    def summary(self):
+        lines = []
+        for record in self.records():
+            kind = record["type"]
+            if kind == "run":
+                lines.append(f"Run took {record['seconds']:.1f}s")
+            elif kind == "stage":
+                lines.append(f"  {record['stage']:<10} {record['seconds']:8.2f}s over {record['count']} calls")
+            elif kind == "api":
+                lines.append(f"  {record['method']:<28} {record['count']:5} calls {record['seconds']:7.2f}s "
+                             f"{record['bytes'] / 1024:9.1f} KiB {record['rate_limited']} rate limited")
+            elif kind == "wait":
+                lines.append(f"  Rate limit waits: {record['count']} totalling {record['seconds']:.1f}s")
+            elif kind == "cache":
+                rate = "n/a" if record["hit_rate"] is None else f"{record['hit_rate']:.0%}"
+                lines.append(f"  {record['cache']} cache: {record['hits']} hits, {record['misses']} misses ({rate})")
+        return "\n".join(lines)
+
+recorder = Recorder()
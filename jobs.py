@@ -0,0 +1,24 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class JobQueue:
+
+    def __init__(self, workers=2):
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, key, fn):
+        # Returns (future, started); a duplicate key joins the job already queued or running
+        with self.lock:
+            future = self.jobs.get(key)
+            if future is not None:
+                return future, False
+            future = self.pool.submit(fn)
+            self.jobs[key] = future
+        future.add_done_callback(lambda f: self.finish(key))
+        return future, True
+
+    def finish(self, key):
+        with self.lock:
+            self.jobs.pop(key, None)
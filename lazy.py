@@ -0,0 +1,30 @@
+import importlib
+import threading
+
+class LazyModule:
+
+    # Stands in for a module and imports it on first attribute access, so pandas, matplotlib
+    # and PIL only load in runs that actually aggregate or render
+    def __init__(self, name, setup=None):
+        self._name = name
+        self._setup = setup
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                if self._setup is not None:
+                    self._setup()
+                self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._module or self._load(), attr)
+
+def headless():
+    # pyplot picks its backend on import, and the runners have no display
+    importlib.import_module("matplotlib").use("Agg")
+
+def lazy(name, setup=None):
+    return LazyModule(name, setup)
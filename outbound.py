@@ -0,0 +1,85 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from slack_sdk.errors import SlackApiError
+from ratelimit import TokenBucket, call
+from instrument import recorder
+
+# chat.postMessage allows about one message per second per channel, with short bursts
+PER_CHANNEL = 60
+
+class Outbound:
+
+    # Posts to one channel go through a single worker so threads stay in order;
+    # different channels post in parallel. Every post resolves to its message ts.
+    # Pending posts are tracked per calling thread, so each job flushes only its own posts.
+    def __init__(self, client):
+        self.client = client
+        self.workers = {}
+        self.limits = {}
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        # files.info needs the files:read scope; without it an upload's ts comes from the channel history
+        self.file_info = True
+
+    def channel(self, channel):
+        with self.lock:
+            if channel not in self.workers:
+                self.workers[channel] = ThreadPoolExecutor(max_workers=1)
+                self.limits[channel] = TokenBucket(PER_CHANNEL, burst=3)
+            return self.workers[channel], self.limits[channel]
+
+    def post(self, channel, text, thread_ts=None, img=None, filename=None):
+        worker, limit = self.channel(channel)
+        future = worker.submit(self.send, channel, limit, text, thread_ts, img, filename)
+        self.pending().append(future)
+        return future
+
+    def pending(self):
+        if not hasattr(self.local, "pending"):
+            self.local.pending = []
+        return self.local.pending
+
+    def send(self, channel, limit, text, thread_ts, img, filename):
+        if isinstance(thread_ts, Future):
+            # A failed parent falls back to replying to the channel's latest message
+            thread_ts = thread_ts.result() or True
+        with recorder.stage("post"):
+            try:
+                if thread_ts is True:
+                    thread_ts = self.latest(channel, limit)
+                if img is not None:
+                    response = call(limit, self.client.files_upload_v2, channel=channel, initial_comment=text,
+                                    content=img, filename=filename, thread_ts=thread_ts)
+                    return self.share_ts(channel, limit, response["files"][0]["id"])
+                response = call(limit, self.client.chat_postMessage, channel=channel, text=text, thread_ts=thread_ts)
+                return response["ts"]
+            except SlackApiError as e:
+                print(f"Error: {e}")
+                logging.info(f"Slack Error {e}")
+
+    def latest(self, channel, limit):
+        response = call(limit, self.client.conversations_history, channel=channel, limit=1)
+        return response['messages'][0]['ts']
+
+    def share_ts(self, channel, limit, file_id, attempts=5):
+        # Uploads are shared asynchronously, so the message ts can take a moment to appear
+        for attempt in range(attempts if self.file_info else 0):
+            try:
+                shares = call(limit, self.client.files_info, file=file_id)["file"].get("shares", {})
+            except SlackApiError as e:
+                logging.info(f"files.info unavailable, using channel history for upload ts: {e}")
+                self.file_info = False
+                break
+            for visibility in shares.values():
+                if channel in visibility:
+                    return visibility[channel][0]["ts"]
+            time.sleep(0.5 * (attempt + 1))
+        return self.latest(channel, limit)
+
+    def flush(self):
+        futures, self.local.pending = self.pending(), []
+        wait(futures)
+        for future in futures:
+            future.result()
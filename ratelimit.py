@@ -0,0 +1,74 @@
+import json
+import logging
+import threading
+import time
+from slack_sdk.errors import SlackApiError
+from instrument import recorder
+
+# Requests per minute for Slack's Web API tiers (conversations.history/replies are Tier 3)
+TIER_2 = 20
+TIER_3 = 50
+
+class TokenBucket:
+
+    def __init__(self, per_minute, burst=5):
+        self.rate = per_minute / 60
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                self.refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            recorder.wait(wait)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        # Push the bucket into debt so every worker sharing it waits out the Retry-After
+        with self.lock:
+            self.refill()
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+def header(response, name):
+    for k, v in getattr(response, "headers", {}).items():
+        if k.lower() == name:
+            return v
+    return None
+
+def retry_after(response):
+    delay = header(response, "retry-after")
+    return int(delay) if delay is not None else 1
+
+def size(response):
+    length = header(response, "content-length")
+    if length is not None:
+        return int(length)
+    return len(json.dumps(getattr(response, "data", response), default=str))
+
+def call(bucket, method, retries=3, **kwargs):
+    for attempt in range(retries + 1):
+        bucket.acquire()
+        begin = time.perf_counter()
+        try:
+            response = method(**kwargs)
+            recorder.call(method.__name__, time.perf_counter() - begin, size(response))
+            return response
+        except SlackApiError as e:
+            recorder.call(method.__name__, time.perf_counter() - begin, 0)
+            if e.response.status_code != 429 or attempt == retries:
+                raise
+            delay = retry_after(e.response)
+            recorder.rate_limited(method.__name__)
+            logging.info(f"Rate limited, retrying in {delay}s")
+            bucket.pause(delay)
@@ -1,11 +1,15 @@
-from slack_sdk import WebClient 
 from slack_sdk.errors import SlackApiError
 import json
 import datetime
-import requests
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from ratelimit import TokenBucket, TIER_2, call
+from clients import get_client
 from dotenv import load_dotenv
+from lazy import lazy
+
+requests = lazy("requests")
 
 logging.basicConfig(
     filename="reset.log",
@@ -16,6 +20,10 @@ logging.basicConfig(
 load_dotenv()
 BOT_USER = "U09BZRB5LMQ"
 TOKEN = os.getenv("SLACK_TOKEN_25_26")
+MANIFEST = "profiles.json"
+DIRECTORY = "users_cache.json"
+DIRECTORY_TTL = 24 * 3600
+WORKERS = 8
 
 def reset_info():
 	info = {"start": datetime.datetime.now().timestamp()}
@@ -42,30 +50,107 @@ def fix(img_path):
 
 	output_image.save(img_path, 'PNG')
 
-def get_people(channel_id):
-	client = WebClient(token=TOKEN)
+def load_manifest():
+	if os.path.exists(MANIFEST):
+		with open(MANIFEST, "r") as f:
+			return json.load(f)
+	return {}
+
+def sync_avatar(session, uid, url, manifest):
+	# Slack changes the image URL whenever an avatar changes, so an unchanged URL means an unchanged file
+	path = os.path.join("profiles", f"{uid}.png")
+	if manifest.get(uid) == url and os.path.exists(path):
+		return False
+	r = session.get(url, timeout=30)
+	r.raise_for_status()
+	with open(path, 'wb') as file:
+		file.write(r.content)
+	fix(path)
+	return True
+
+def get_directory(client, ttl=DIRECTORY_TTL):
+	if os.path.exists(DIRECTORY):
+		with open(DIRECTORY, "r") as f:
+			cached = json.load(f)
+		if datetime.datetime.now().timestamp() - cached["fetched"] < ttl:
+			return cached["users"]
+
+	limit = TokenBucket(TIER_2)
+	users, cursor = {}, None
+	while True:
+		response = call(limit, client.users_list, cursor=cursor, limit=200)
+		for user in response["members"]:
+			users[user["id"]] = {"real_name": user.get("real_name", user["profile"].get("real_name", user["name"])),
+								 "image_512": user["profile"].get("image_512")}
+		cursor = response.get("response_metadata", {}).get("next_cursor")
+		if not cursor:
+			break
+
+	with open(DIRECTORY, "w") as f:
+		json.dump({"fetched": datetime.datetime.now().timestamp(), "users": users}, f)
+	return users
+
+def get_members(client, channel_id):
+	members, cursor = [], None
+	while True:
+		response = client.conversations_members(channel=channel_id, cursor=cursor)
+		members += response["members"]
+		cursor = response.get("response_metadata", {}).get("next_cursor")
+		if not cursor:
+			break
+	return [u for u in members if u != BOT_USER]
+
+def resolve_members(client, channel_id, ttl=DIRECTORY_TTL):
+	directory = get_directory(client, ttl)
+	members = get_members(client, channel_id)
+	missing = [u for u in members if u not in directory]
+	if missing:
+		logging.info(f"{len(missing)} channel members missing from users.list: {missing}")
+	return {u: directory[u] for u in members if u in directory}
+
+def load_people(channel_id, client=None):
+	# Roster for commands: people.json if the reset wrote one, else names from the cached directory (no avatars)
+	if os.path.exists("people.json"):
+		with open("people.json", "r") as f:
+			return json.load(f)
+	try:
+		profiles = resolve_members(client or get_client(TOKEN), channel_id)
+	except SlackApiError as e:
+		logging.error(f"Slack API error: {e}")
+		return {}
+	people = {u: p["real_name"] for u, p in profiles.items()}
+	with open("people.json", "w") as f:
+		json.dump(people, f)
+	return people
+
+def get_people(channel_id, client=None):
+	client = client or get_client(TOKEN)
 
 	if not os.path.isdir("profiles"):
 		os.makedirs("profiles")
 
 	try:
-		ppl = client.conversations_members(channel=channel_id)
-		people = {}
-		for u in ppl["members"]:
-			if u == BOT_USER:
-				continue
-
-			response = client.users_info(user=u)
-			people[response['user']['id']] = response['user']['real_name']
-			url = (response['user']['profile']['image_512'])
-			r = requests.get(url)
-			path = os.path.join("profiles", f"{response['user']['id']}.png")
-			with open(path, 'wb') as file:
-				file.write(r.content)
-			fix(path)
+		# A reset always wants current names and avatars, so skip the cached directory
+		profiles = resolve_members(client, channel_id, ttl=0)
+		manifest = load_manifest()
+
+		session = requests.Session()
+		session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=WORKERS))
+
+		def sync(u):
+			return sync_avatar(session, u, profiles[u]["image_512"], manifest)
+
+		with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+			changed = list(pool.map(sync, profiles))
+
+		people = {u: p["real_name"] for u, p in profiles.items()}
+		manifest.update({u: p["image_512"] for u, p in profiles.items()})
+		logging.info(f"{len(people)} profiles synced, {sum(changed)} avatars downloaded")
 
 		with open("people.json", "w") as f:
 			json.dump(people, f)
+		with open(MANIFEST, "w") as f:
+			json.dump(manifest, f)
 		
 	except SlackApiError as e:
 		print(f"Error: {e}")
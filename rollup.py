@@ -0,0 +1,125 @@
+import datetime
+import json
+import os
+from aggregate import MetricTable
+from scoring import METRICS, SIGNATURE
+from lazy import lazy
+
+np = lazy("numpy")
+pd = lazy("pandas")
+
+class WeeklyRollup:
+
+    # Per-week sums keyed by the week's Monday (team timezone) and (author, person),
+    # so roster filtering at query time matches get_metrics exactly
+    def __init__(self, store, scores, timezone, path="weekly.json"):
+        self.store = store
+        self.scores = scores
+        self.timezone = timezone
+        self.path = path
+        self.weeks = None
+        # Event threads rewrite weeks while command jobs total them, so both go through the score cache's lock
+        self.lock = scores.lock
+
+    def load(self):
+        with self.lock:
+            if self.weeks is not None:
+                return
+            source = None
+            if self.path and os.path.exists(self.path):
+                with open(self.path, "r") as f:
+                    saved = json.load(f)
+                self.weeks, source = saved["weeks"], saved["source"]
+            if source != self.source():
+                self.weeks = {}
+                self.replace(self.table())
+                self.save()
+
+    def save(self):
+        with self.lock:
+            if self.path:
+                with open(self.path, "w") as f:
+                    json.dump({"source": self.source(), "weeks": self.weeks}, f)
+
+    def source(self):
+        # Saved weeks are only valid for the tag table that scored them and the store they were built from
+        return [SIGNATURE, self.store.fingerprint()]
+
+    def week_start(self, ts):
+        local = datetime.datetime.fromtimestamp(ts, self.timezone)
+        return (local - datetime.timedelta(days=local.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def week_bounds(self, key):
+        start = datetime.datetime.combine(datetime.date.fromisoformat(key), datetime.time(), self.timezone)
+        end = start + datetime.timedelta(days=7) - datetime.timedelta(microseconds=1)
+        return start.timestamp(), end.timestamp()
+
+    def replace(self, table, keys=()):
+        for key in keys:
+            self.weeks.pop(key, None)
+        if len(table.ts) == 0:
+            return
+        weeks, codes = np.unique(table.week_starts(self.timezone), return_inverse=True)
+        keys = np.array([datetime.datetime.fromtimestamp(w, self.timezone).date().isoformat() for w in weeks], dtype=object)
+        frame = pd.DataFrame(table.values, columns=METRICS)
+        frame["week"] = keys[codes.reshape(-1)]
+        frame["author"] = np.array(table.vocab, dtype=object)[table.authors]
+        frame["person"] = np.array(table.vocab, dtype=object)[table.people]
+        grouped = frame.groupby(["week", "author", "person"], sort=False)[METRICS].sum().reset_index()
+        for key, rows in grouped.groupby("week"):
+            self.weeks[key] = rows[["author", "person"] + METRICS].values.tolist()
+
+    def update(self, ts_values):
+        with self.lock:
+            self.load()
+            keys = {self.week_start(float(ts)).date().isoformat() for ts in ts_values}
+            if not keys:
+                return
+            bounds = [self.week_bounds(key) for key in keys]
+            self.replace(self.table(min(b[0] for b in bounds), max(b[1] for b in bounds)), keys)
+            self.save()
+
+    def week_totals(self, key, codes, out):
+        for author, person, *values in self.weeks.get(key, []):
+            if author in codes and person in codes:
+                out[codes[person]] += values
+
+    def totals(self, users, start, end=None):
+        # Whole weeks inside [start, end] come from the rollup; only the partial weeks at the edges are scanned
+        with self.lock:
+            self.load()
+            users = list(users)
+            codes = {u: i for i, u in enumerate(users)}
+            out = np.zeros((len(users), len(METRICS)))
+
+            first = self.week_start(start)
+            if first.timestamp() < start:
+                first += datetime.timedelta(days=7)
+            first_key, last_key = first.date().isoformat(), None
+
+            if end is not None:
+                last = self.week_start(end)
+                if self.week_bounds(last.date().isoformat())[1] > end:
+                    last -= datetime.timedelta(days=7)
+                if last < first:
+                    return self.scan(users, start, end)
+                last_key = last.date().isoformat()
+                full_end = self.week_bounds(last_key)[1]
+                if full_end < end:
+                    out += self.scan(users, full_end + 1e-6, end)
+
+            if first.timestamp() > start:
+                out += self.scan(users, start, first.timestamp() - 1e-6)
+            for key in self.weeks:
+                if key >= first_key and (last_key is None or key <= last_key):
+                    self.week_totals(key, codes, out)
+            return out
+
+    def table(self, start=None, end=None, users=None):
+        # Columnar stores hand back pre-extracted metrics instead of message text
+        if hasattr(self.store, "table"):
+            return self.store.table(self.scores, users, start, end)
+        return MetricTable.from_messages(self.store.load(start, end), self.scores, users)
+
+    def scan(self, users, start, end):
+        return self.table(start, end, users).by_user()
@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from instrument import recorder
+
+# tag -> (metric, points per occurrence); a weight of None scores the number after the tag
+TAGS = {
+    "throw": ("throw", None),
+    "gym": ("gym", 1),
+    "cardio": ("gym", 1),
+    "upper": ("gym", .5),
+    "recovery": ("gym", .5),
+    "lift": ("lift", 1.5),
+    "workout": ("workout", 1.5),
+    "sauna": ("sauna", .01),
+}
+METRICS = ["throw", "gym", "lift", "workout", "sauna"]
+
+TOKENS = re.compile("<@([^>]+)>|!(" + "|".join(map(re.escape, TAGS)) + ")(?: (-?[0-9]+))?")
+SLOTS = {tag: (METRICS.index(metric), weight) for tag, (metric, weight) in TAGS.items()}
+# Cached scores are only valid for the tag table that produced them
+SIGNATURE = hashlib.blake2b(json.dumps([TAGS, METRICS]).encode(), digest_size=8).hexdigest()
+
+def parse_text(txt):
+    mentions, counts, totals = [], {}, [0] * len(METRICS)
+    for mention, tag, number in TOKENS.findall(txt):
+        if mention:
+            mentions.append(mention)
+        elif SLOTS[tag][1] is None:
+            if number:
+                totals[SLOTS[tag][0]] += int(number)
+        else:
+            counts[tag] = counts.get(tag, 0) + 1
+
+    for tag, n in counts.items():
+        slot, weight = SLOTS[tag]
+        totals[slot] += weight * n
+    return (mentions, *totals)
+
+class ScoreCache:
+
+    def __init__(self, path="scores.json"):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        self.hits, self.misses = 0, 0
+        # Shared with the weekly rollup: event threads write both while command jobs read them
+        self.lock = threading.RLock()
+        if path and os.path.exists(path):
+            with open(path, "r") as f:
+                cached = json.load(f)
+            if cached.get("tags") == SIGNATURE:
+                self.entries = cached["entries"]
+
+    def get(self, ts, user, txt):
+        if not isinstance(txt, str):
+            raise ValueError("message has no text")
+        digest = hashlib.blake2b(txt.encode(), digest_size=8).hexdigest()
+        with self.lock:
+            entry = self.entries.get(ts)
+            if entry is not None and entry[0] == digest:
+                self.hits += 1
+                return entry[1]
+            # [author, mentions, throw, gym, lift, workout, sauna]
+            with recorder.stage("parse"):
+                record = [user, *parse_text(txt)]
+            self.entries[ts] = [digest, record]
+            self.misses += 1
+            self.dirty = True
+            return record
+
+    def save(self):
+        with self.lock:
+            if self.path and self.dirty:
+                with open(self.path, "w") as f:
+                    json.dump({"tags": SIGNATURE, "entries": self.entries}, f)
+                self.dirty = False
@@ -0,0 +1,295 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from lazy import lazy
+
+pd = lazy("pandas")
+
+COLUMNS = ["ts", "text", "user", "thread_ts"]
+TOMBSTONE = object()
+
+def in_window(df, start=None, end=None):
+    ts = pd.to_numeric(df["ts"], errors="coerce")
+    mask = pd.Series(True, index=df.index)
+    if start is not None:
+        mask &= ts >= start
+    if end is not None:
+        mask &= ts <= end
+    return df[mask]
+
+class CsvStore:
+
+    CHUNK = 5000
+
+    # In append mode new and edited rows are appended and the last row for a ts wins on read,
+    # so a write never rereads message bodies or rewrites the file. A deletion appends a
+    # tombstone: a row with only its ts. Stored messages always have a user, so readers drop those.
+    def __init__(self, path="messages.csv", append=False):
+        self.path = path
+        self.append = append
+
+    def fingerprint(self):
+        # A content hash, so a same-length hand edit still invalidates anything derived from the file
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            return hashlib.file_digest(f, "blake2b").hexdigest()
+
+    def chunks(self, start=None, end=None, usecols=None):
+        if not os.path.exists(self.path):
+            return
+        for chunk in pd.read_csv(self.path, dtype=str, chunksize=self.CHUNK, usecols=usecols):
+            yield in_window(chunk, start, end)
+
+    def load(self, start=None, end=None):
+        frames = list(self.chunks(start, end))
+        if not frames:
+            return pd.DataFrame(columns=COLUMNS)
+        df = pd.concat(frames, ignore_index=True).drop_duplicates(subset=["ts"], keep="last")
+        return df[df["user"].notna()]
+
+    def upsert(self, df2):
+        if not self.append:
+            return self.rewrite(df2)
+
+        exists = os.path.exists(self.path)
+        header = list(pd.read_csv(self.path, dtype=str, nrows=0).columns) if exists else list(df2.columns)
+        if any(col not in header for col in df2.columns):
+            # A new column can't be appended under the old header
+            return self.rewrite(df2)
+
+        if df2.empty:
+            logging.info("No new messages to write")
+            if not exists:
+                pd.DataFrame(columns=header).to_csv(self.path, index=False)
+            return 0, 0
+
+        df2 = df2.drop_duplicates(subset=["ts"], keep="last").reindex(columns=header)
+        incoming = set(df2["ts"])
+        latest, old_length = {}, 0
+        for chunk in self.chunks(usecols=["ts", "text", "user"]):
+            old_length += len(chunk)
+            hit = chunk[chunk["ts"].isin(incoming)]
+            latest.update((ts, text if isinstance(user, str) else TOMBSTONE) for ts, text, user in zip(hit["ts"], hit["text"], hit["user"]))
+
+        is_new = df2["ts"].map(lambda ts: latest.get(ts, TOMBSTONE) is TOMBSTONE)
+        old_text = df2["ts"].map(lambda ts: latest.get(ts)).where(~is_new)
+        changed = is_new | ((old_text != df2["text"]) & ~(old_text.isna() & df2["text"].isna()))
+        new_msgs, updates = int(is_new.sum()), int((changed & ~is_new).sum())
+
+        df2[changed].to_csv(self.path, mode="a", header=not exists, index=False)
+        logging.info(f"{old_length} rows -> {old_length + int(changed.sum())} rows " f"({new_msgs} new, {updates} edits appended)")
+        return new_msgs, updates
+
+    def compact(self):
+        df = self.load()
+        df.to_csv(self.path, index=False)
+        return len(df)
+
+    def rewrite(self, df2):
+        if os.path.exists(self.path):
+            df1 = pd.read_csv(self.path, dtype=str)
+        else:
+            df1 = pd.DataFrame(columns=df2.columns)
+
+        if df2.empty:
+            logging.info("No new messages to write")
+            df1.to_csv(self.path, index=False)
+            return 0, 0
+
+        old_length = len(df1)
+
+        for col in df2.columns:
+            if col not in df1.columns:
+                df1[col] = None
+        for col in df1.columns:
+            if col not in df2.columns:
+                df2[col] = None
+
+        df1 = df1.drop_duplicates(subset=["ts"], keep="last").set_index("ts")
+        df2 = df2.drop_duplicates(subset=["ts"], keep="last").set_index("ts")[df1.columns]
+
+        merged = df1[["text"]].merge(df2[["text"]], how="outer", left_index=True, right_index=True,
+                                     suffixes=("_old", "_new"), indicator=True)
+        new_ts = merged.index[merged["_merge"] == "right_only"]
+        edited_ts = merged.index[(merged["_merge"] == "both") & (merged["text_old"] != merged["text_new"])]
+        new_msgs, updates = len(new_ts), len(edited_ts)
+
+        # Edits are replaced in place so the committed CSV diff stays small; new rows are appended
+        df1.loc[edited_ts] = df2.loc[edited_ts]
+        df1 = pd.concat([df1, df2.loc[new_ts]])
+
+        df1 = df1.reset_index()
+
+        logging.info(f"{old_length} rows -> {len(df1)} rows " f"({new_msgs} new, {updates} edits updated)")
+        df1.to_csv(self.path, index=False)
+        return new_msgs, updates
+
+    def delete(self, ts_values):
+        if self.append:
+            return self.tombstone(ts_values)
+        ts_values = list(ts_values)
+        tmp, removed, first = self.path + ".tmp", 0, True
+        for chunk in self.chunks():
+            keep = ~chunk["ts"].isin(ts_values)
+            removed += int((~keep).sum())
+            chunk[keep].to_csv(tmp, mode="w" if first else "a", header=first, index=False)
+            first = False
+        if removed:
+            os.replace(tmp, self.path)
+            logging.info(f"{removed} deleted messages removed")
+        elif not first:
+            os.remove(tmp)
+        return removed
+
+    def tombstone(self, ts_values):
+        ts_values, alive = set(ts_values), {}
+        for chunk in self.chunks(usecols=["ts", "user"]):
+            hit = chunk[chunk["ts"].isin(ts_values)]
+            alive.update(zip(hit["ts"], hit["user"].notna()))
+        dead = sorted(ts for ts, live in alive.items() if live)
+        if dead:
+            header = list(pd.read_csv(self.path, dtype=str, nrows=0).columns)
+            pd.DataFrame({"ts": dead}).reindex(columns=header).to_csv(self.path, mode="a", header=False, index=False)
+            logging.info(f"{len(dead)} deleted messages tombstoned")
+        return len(dead)
+
+class SqliteStore:
+
+    def __init__(self, path="messages.db"):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (ts TEXT PRIMARY KEY, text TEXT, user TEXT, thread_ts TEXT);
+            CREATE INDEX IF NOT EXISTS messages_ts ON messages (CAST(ts AS REAL));
+            CREATE INDEX IF NOT EXISTS messages_user ON messages (user);
+        """)
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def fingerprint(self):
+        return list(self.conn.execute("SELECT COUNT(*), MAX(ts), SUM(LENGTH(text)) FROM messages").fetchone())
+
+    def load(self, start=None, end=None):
+        query, params = "SELECT ts, text, user, thread_ts FROM messages WHERE 1=1", []
+        if start is not None:
+            query += " AND CAST(ts AS REAL) >= ?"
+            params.append(start)
+        if end is not None:
+            query += " AND CAST(ts AS REAL) <= ?"
+            params.append(end)
+        return pd.read_sql_query(query, self.conn, params=params)
+
+    def upsert(self, df2):
+        if df2.empty:
+            logging.info("No new messages to write")
+            return 0, 0
+
+        rows = [tuple(None if pd.isna(r.get(c)) else r.get(c) for c in COLUMNS) for r in df2.to_dict("records")]
+        old_length = self.count()
+        before = self.conn.total_changes
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO messages (ts, text, user, thread_ts) VALUES (?, ?, ?, ?)
+                ON CONFLICT (ts) DO UPDATE SET text = excluded.text, user = excluded.user, thread_ts = excluded.thread_ts
+                WHERE messages.text IS NOT excluded.text
+            """, rows)
+        length = self.count()
+        new_msgs = length - old_length
+        updates = self.conn.total_changes - before - new_msgs
+
+        logging.info(f"{old_length} rows -> {length} rows " f"({new_msgs} new, {updates} edits updated)")
+        return new_msgs, updates
+
+    def delete(self, ts_values):
+        with self.conn:
+            removed = self.conn.executemany("DELETE FROM messages WHERE ts = ?", [(ts,) for ts in ts_values]).rowcount
+        if removed:
+            logging.info(f"{removed} deleted messages removed")
+        return removed
+
+    def migrate(self, csv_path="messages.csv"):
+        logging.info(f"Migrating {csv_path} to {self.path}")
+        new_msgs, updates = 0, 0
+        for chunk in CsvStore(csv_path).chunks():
+            chunk = chunk.drop_duplicates(subset=["ts"], keep="last")
+            dead = chunk["user"].isna()
+            n, u = self.upsert(chunk[~dead])
+            self.delete(chunk.loc[dead, "ts"])
+            new_msgs, updates = new_msgs + n, updates + u
+        return new_msgs, updates
+
+class MemoryStore:
+
+    # Keeps every message in memory for a long-running process and writes through to the backing store.
+    # The first read loads the backing store, so starting the process doesn't wait on it.
+    def __init__(self, backing):
+        self.backing = backing
+        self.lock = threading.Lock()
+        self.df = None
+
+    def frame(self):
+        if self.df is None:
+            self.df = self.backing.load()
+        return self.df
+
+    def fingerprint(self):
+        return self.backing.fingerprint()
+
+    def load(self, start=None, end=None):
+        with self.lock:
+            return in_window(self.frame(), start, end).copy()
+
+    def upsert(self, df2):
+        with self.lock:
+            df = self.frame()
+            result = self.backing.upsert(df2)
+            if not df2.empty:
+                rows = df2.drop_duplicates(subset=["ts"], keep="last")
+                self.df = pd.concat([df[~df["ts"].isin(rows["ts"])], rows], ignore_index=True)
+            return result
+
+    def delete(self, ts_values):
+        ts_values = list(ts_values)
+        with self.lock:
+            df = self.frame()
+            self.df = df[~df["ts"].isin(ts_values)]
+            return self.backing.delete(ts_values)
+
+def open_store(path=None):
+    path = path or os.getenv("MESSAGE_STORE", "messages.csv")
+    if path.endswith(".db"):
+        fresh = not os.path.exists(path)
+        store = SqliteStore(path)
+        if fresh and os.path.exists("messages.csv"):
+            store.migrate("messages.csv")
+        return store
+    if path.endswith(".npz"):
+        from archive import ColumnStore
+        fresh = not os.path.exists(path)
+        store = ColumnStore(path)
+        if fresh and os.path.exists("messages.csv"):
+            store.migrate("messages.csv")
+        return store
+    return CsvStore(path, append=True)
+
+if __name__ == "__main__":
+    # python store.py migrate [messages.csv] [messages.db | messages.npz]
+    # python store.py compact [messages.csv]
+    command, args = (sys.argv[1:2] or ["migrate"])[0], sys.argv[2:]
+    if command == "compact":
+        path = (args or ["messages.csv"])[0]
+        print(f"{CsvStore(path).compact()} messages kept in {path}")
+    else:
+        args = args + ["messages.csv", "messages.db"][len(args):]
+        if args[1].endswith(".npz"):
+            from archive import ColumnStore
+            target = ColumnStore(args[1])
+        else:
+            target = SqliteStore(args[1])
+        new_msgs, updates = target.migrate(args[0])
+        print(f"{new_msgs} messages migrated to {args[1]}")